@@ -0,0 +1,90 @@
+"""
+Microbenchmark: append + serialize cost of the step log as a session grows to 10k steps.
+
+Run from backend/:  python -m benchmarks.bench_steplog
+"""
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from core.models import Scratchpad
+from core.scratchpad import dump_scratchpad_json
+
+N_STEPS = 10_000
+PUSH_EVERY = 100  # the websocket pushes after every new step; sample every 100th
+
+
+class _LegacyStep(BaseModel):
+    step_id: int
+    phase: str
+    action: Optional[str] = None
+    arguments: Optional[Dict] = None
+    result: Optional[str] = None
+    timestamp: str = Field(default_factory=lambda: datetime.now().isoformat())
+
+
+class _LegacyPad(BaseModel):
+    steps: List[_LegacyStep] = []
+
+
+def _args(i):
+    return {"path": f"notes/file_{i}.md"}
+
+
+def _run(append, dump):
+    # Both sides serialize at the same sizes: after every PUSH_EVERY-th append
+    t_append = 0.0
+    t_dump = 0.0
+    for i in range(N_STEPS):
+        t0 = time.perf_counter()
+        append(i)
+        t_append += time.perf_counter() - t0
+        if (i + 1) % PUSH_EVERY == 0:
+            t0 = time.perf_counter()
+            dump()
+            t_dump += time.perf_counter() - t0
+    return t_append, t_dump
+
+
+def bench_legacy():
+    pad = _LegacyPad()
+
+    def append(i):
+        pad.steps.append(_LegacyStep(step_id=i + 1, phase="execution", action="fs_read",
+                                     arguments=_args(i), result="{'content': 'hello'}"))
+
+    return _run(append, pad.model_dump_json)
+
+
+def bench_steplog():
+    pad = Scratchpad(meta={"session_id": "bench"})
+
+    def append(i):
+        pad.steps.append(phase="execution", action="fs_read",
+                         arguments=_args(i), result="{'content': 'hello'}")
+
+    return _run(append, lambda: dump_scratchpad_json(pad))
+
+
+def bench_steplog_cold():
+    """Full re-encode of 10k steps, e.g. the first push after loading a session."""
+    pad = Scratchpad(meta={"session_id": "bench"})
+    for i in range(N_STEPS):
+        pad.steps.append(phase="execution", action="fs_read",
+                         arguments=_args(i), result="{'content': 'hello'}")
+    t0 = time.perf_counter()
+    dump_scratchpad_json(pad)
+    return time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    pushes = N_STEPS // PUSH_EVERY
+    la, ld = bench_legacy()
+    sa, sd = bench_steplog()
+    cold = bench_steplog_cold()
+    print(f"{N_STEPS} steps, {pushes} serializations (one every {PUSH_EVERY} steps)")
+    print(f"legacy pydantic : append {la * 1e3:8.1f} ms   serialize {ld * 1e3:8.1f} ms")
+    print(f"step log        : append {sa * 1e3:8.1f} ms   serialize {sd * 1e3:8.1f} ms")
+    print(f"step log cold encode of {N_STEPS} steps: {cold * 1e3:.1f} ms")
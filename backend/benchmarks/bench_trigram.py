@@ -0,0 +1,62 @@
+"""
+Microbenchmark: the kg_grep tool with and without trigram narrowing, timed through
+the tool executor (process start, pickling of candidate docs, regex scan).
+
+Run from backend/:  python -m benchmarks.bench_trigram [folder]
+(defaults to the Python standard library)
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from core.kernel import AgentKernel
+from tools.tools import ToolRegistry
+
+PATTERNS = [
+    r"def load_.*model",
+    r"class \w+Error\(",
+    r"import asyncio",
+    r"(ThreadPoolExecutor|ProcessPoolExecutor)\(",
+    r"TODO",
+    r"\w+",
+]
+REPEAT = 5
+
+
+async def timed_grep(tools, pattern):
+    times = []
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        out = await tools.executor.run("kg_grep", {"pattern": pattern, "max_results": 10_000})
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times), out
+
+
+async def main(folder):
+    tools = AgentKernel("bench", ToolRegistry(None)).tools
+
+    t0 = time.perf_counter()
+    indexed = await tools.executor.run("index_folder", {"path": folder})
+    t_scan = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    await tools._trigram_build
+    t_build = time.perf_counter() - t0
+    print(f"{folder}: {indexed['files_indexed']} files indexed ({indexed['files_seen']} seen) in {t_scan:.1f} s, "
+          f"trigrams built in {t_build:.1f} s (background)")
+
+    await timed_grep(tools, "warm up the forkserver")
+    trigrams = tools._trigrams
+    for pattern in PATTERNS:
+        tools._trigrams = None
+        t_full, full = await timed_grep(tools, pattern)
+        tools._trigrams = trigrams
+        t_grep, out = await timed_grep(tools, pattern)
+        files = len({r["path"] for r in out["results"]})
+        print(f"{pattern!r:50} no trigrams {t_full * 1e3:7.1f} ms ({full['files_scanned']} scanned)   "
+              f"kg_grep {t_grep * 1e3:7.1f} ms ({out['files_scanned']} scanned, {files} files hit)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.__file__)))
@@ -3,8 +3,9 @@ import os
 import json
 import re
 import ast
-from core.models import Scratchpad, Step, UIAction, UserInteraction
+from core.models import Scratchpad, UIAction, UserInteraction
 from core.scratchpad import save_scratchpad
+from core.program import AFTER_KEY, PLAN_KEY, ProgramCall, execute_program, parse_program
 
 class AgentKernel:
     def __init__(self, session_id, tools):
@@ -15,6 +16,7 @@ class AgentKernel:
         self.tools.kernel = self 
         self.last_action = None  # track last executed tool/args to avoid repeats
         self.reject_count = 0    # track repeated rejections
+        self.retry_hint = None   # correction for the next generation; never folded into the user request
 
     def update_plan_direct(self, plan_data):
         self.scratchpad.plan = plan_data
@@ -22,18 +24,123 @@ class AgentKernel:
     async def queue_user_response(self, response: str):
         await self.user_input_queue.put(response)
 
+    def _align_app_name(self, args: dict) -> bool:
+        """
+        Checks mac_open_app against the user's request and fixes app_name in place.
+        Returns False when the request has no open intent (the call must not run).
+        """
+        raw_request = self.scratchpad.user_interaction.last_user_response or ""
+        user_request = raw_request.lower().strip()
+        # Require explicit open intent; otherwise hard-block
+        open_intents = ["open", "launch", "start", "run"]
+        if not any(word in user_request for word in open_intents):
+            return False
+        # Align app_name with user intent when the model defaults incorrectly (e.g., Safari)
+        app_map = {
+            "notes": "Notes",
+            "note": "Notes",
+            "safari": "Safari",
+            "chrome": "Google Chrome",
+            "google chrome": "Google Chrome",
+            "finder": "Finder",
+            "terminal": "Terminal",
+            "iterm": "iTerm",
+            "calendar": "Calendar",
+            "spotify": "Spotify"
+        }
+        resolved_app = None
+        for key, app in app_map.items():
+            if key in user_request:
+                resolved_app = app
+                break
+        # Heuristic: if the user says "open X" then take X as app name (title-cased)
+        if not resolved_app and user_request.startswith("open "):
+            candidate = raw_request.split(" ", 1)[1].strip()
+            if candidate:
+                resolved_app = candidate.title()
+        if resolved_app:
+            args["app_name"] = resolved_app
+        return True
+
+    def _check_fs_read(self, args: dict, may_be_created: bool = False):
+        """Returns a UIAction asking the user for a usable path, or None if fs_read can run."""
+        path = (args or {}).get("path")
+        if not isinstance(path, str) or not path or path.strip() in {"file.txt", "path/to/file", "your_file.txt"}:
+            return UIAction(
+                type="prompt",
+                title="Input Needed",
+                message="Which file path should I read? (e.g., backend/runtime/model.py)",
+                options=[]
+            )
+        if not may_be_created and not os.path.exists(path):
+            return UIAction(
+                type="prompt",
+                title="File Not Found",
+                message=f"File not found: {path}. Provide an existing path.",
+                options=[]
+            )
+        return None
+
+    def _set_plan_status(self, plan_id, status: str):
+        for item in self.scratchpad.plan:
+            if item.id == plan_id:
+                item.status = status
+                return
+
+    async def run_program(self, calls: list[ProgramCall], run_tool) -> list:
+        """
+        Executes a multi-call program from one generation, keeping PlanItem.status in
+        sync as calls start and finish. Returns the (call, result) pairs that failed.
+        """
+        plan_for = {}
+        failures = []
+
+        def assign_plan_items():
+            # Runs once update_plan (a barrier) is done: bind calls to pending items in block order
+            if plan_for:
+                return
+            pending = [p.id for p in self.scratchpad.plan if p.status != "done"]
+            for c in calls:
+                if c.tool == "update_plan":
+                    continue
+                if c.plan_id is not None:
+                    plan_for[c.index] = c.plan_id
+                elif pending:
+                    plan_for[c.index] = pending.pop(0)
+            plan_for[0] = None  # mark as assigned
+
+        def on_start(call):
+            if call.tool != "update_plan":
+                assign_plan_items()
+                self._set_plan_status(plan_for.get(call.index), "running")
+            print(f"Executing [{call.index}]: {call.tool} with {call.args}")
+
+        def on_done(call, result, ok):
+            self.scratchpad.steps.append(
+                phase="execution",
+                action=call.tool,
+                arguments=call.args,
+                result=str(result)
+            )
+            if call.tool != "update_plan":
+                self._set_plan_status(plan_for.get(call.index), "done" if ok else "failed")
+            if not ok:
+                failures.append((call, result))
+            save_scratchpad(self.scratchpad)
+
+        def on_skip(call):
+            print(f"Skipping [{call.index}]: {call.tool} (dependency failed)")
+
+        await execute_program(calls, run_tool, on_start, on_done, on_skip)
+        return failures
+
     async def run_loop(self):
         # --- MAIN LOOP START ---
         from runtime.model import generate_response
 
         async def run_tool(tool: str, tool_args: dict):
-            if not hasattr(self.tools, tool):
-                return {"error": "unknown_tool"}
-            method = getattr(self.tools, tool)
-            try:
-                return await asyncio.wait_for(method(**tool_args), timeout=10)
-            except asyncio.TimeoutError:
-                return {"error": "tool_timeout"}
+            # Concurrency caps, isolation and the tool_timeout contract live in the executor
+            return await self.tools.executor.run(tool, tool_args)
 
         async def handle_deterministic_request(raw_request: str) -> bool:
             """Handles common requests without relying on the model (SLM reliability)."""
@@ -62,13 +169,12 @@ class AgentKernel:
                 await run_tool("fs_write", {"path": readme_path, "content": file_content})
                 read_result = await run_tool("fs_read", {"path": readme_path})
 
-                self.scratchpad.steps.append(Step(
-                    step_id=len(self.scratchpad.steps) + 1,
+                self.scratchpad.steps.append(
                     phase="execution",
                     action="fs_read",
                     arguments={"path": readme_path},
                     result=str(read_result)
-                ))
+                )
                 self.scratchpad.final_output = {"summary": read_result}
                 self.scratchpad.meta.status = "completed"
                 self.scratchpad.user_interaction.last_user_response = None
@@ -79,14 +185,14 @@ class AgentKernel:
             if lower.startswith("index folder "):
                 path = text.split(" ", 2)[2].strip()
                 result = await run_tool("index_folder", {"path": path})
-                self.scratchpad.steps.append(Step(step_id=len(self.scratchpad.steps) + 1, phase="execution", action="index_folder", arguments={"path": path}, result=str(result)))
+                self.scratchpad.steps.append(phase="execution", action="index_folder", arguments={"path": path}, result=str(result))
                 save_scratchpad(self.scratchpad)
                 return True
 
             if lower.startswith("search kg for "):
                 query = text.split(" ", 3)[3].strip()
                 result = await run_tool("kg_search", {"query": query})
-                self.scratchpad.steps.append(Step(step_id=len(self.scratchpad.steps) + 1, phase="execution", action="kg_search", arguments={"query": query}, result=str(result)))
+                self.scratchpad.steps.append(phase="execution", action="kg_search", arguments={"query": query}, result=str(result))
                 save_scratchpad(self.scratchpad)
                 return True
 
@@ -105,6 +211,7 @@ class AgentKernel:
                 response = await self.user_input_queue.get()
                 # DO NOT CLEAR last_user_response HERE (Keep context)
                 self.scratchpad.user_interaction.last_user_response = response
+                self.retry_hint = None  # hints belong to the previous request
                 self.scratchpad.meta.status = "active"
                 self.scratchpad.ui_action = UIAction()
                 save_scratchpad(self.scratchpad)
@@ -122,13 +229,93 @@ class AgentKernel:
             excluded_tools = [] if has_open_intent else ["mac_open_app"]
             allowed_tools = set(getattr(self.tools, "tools", {}).keys()) - set(excluded_tools)
             tools_schema = self.tools.get_schema_string(exclude=excluded_tools)
-            raw_output = generate_response(self.scratchpad, tools_schema)
+            raw_output = generate_response(self.scratchpad, tools_schema, hint=self.retry_hint)
             
             print(f"--- Model Raw Output ---\n{raw_output}\n--- End Output ---")
 
+            # --- MULTI-CALL PROGRAM ---
+            # Several blocks in one generation run as a DAG; the model is only asked
+            # again if a call fails or plan items are left for it to decide on.
+            try:
+                program = parse_program(raw_output)
+            except Exception as e:
+                print(f"Program parse failed ({e}); using first call only.")
+                program = []
+            # ask_user pauses the session, so only the blocks before it can run now
+            multi_call = len(program) > 1
+            ask_call = next((c for c in program if c.tool == "ask_user"), None)
+            if ask_call and multi_call:
+                dropped = program[ask_call.index:]
+                if dropped:
+                    print(f"Dropping blocks after ask_user: {[f'[{c.index}] {c.tool}' for c in dropped]}")
+                program = program[:ask_call.index - 1]
+                for c in program:
+                    c.after = [d for d in c.after if d < ask_call.index]
+            ran_program = multi_call and len(program) > 0
+            if ran_program:
+                forbidden = [c.tool for c in program if c.tool not in allowed_tools]
+                # mac_open_app also needs explicit open intent (and gets its app_name aligned)
+                forbidden += [c.tool for c in program if c.tool == "mac_open_app" and c.tool in allowed_tools
+                              and not self._align_app_name(c.args)]
+                if forbidden:
+                    print(f"Program uses tools that are not allowed: {forbidden}. Retrying...")
+                    self.scratchpad.meta.iteration_count += 1
+                    self.retry_hint = (
+                        "You must only call a tool from AVAILABLE TOOLS. "
+                        f"Do NOT call {', '.join(sorted(set(forbidden)))}."
+                    )
+                    save_scratchpad(self.scratchpad)
+                    await asyncio.sleep(0.2)
+                    continue
+
+                # --- REJECT TEMPLATES ---
+                if any(c.tool in ("tool_name", "tool_name{args}") for c in program):
+                    print("Model is hallucinating format definitions. Retrying...")
+                    await asyncio.sleep(1)
+                    continue
+
+                # Same placeholder / missing-path guard as a lone fs_read; a file that an
+                # earlier block may create doesn't have to exist yet
+                writers = {"fs_write", "fs_write_many", "fs_move", "fs_mkdir"}
+                prompt = None
+                for c in program:
+                    if c.tool == "fs_read":
+                        earlier = any(o.tool in writers for o in program if o.index < c.index)
+                        prompt = self._check_fs_read(c.args, may_be_created=earlier)
+                        if prompt:
+                            break
+                if prompt:
+                    self.scratchpad.meta.status = "awaiting_user_input"
+                    self.scratchpad.ui_action = prompt
+                    save_scratchpad(self.scratchpad)
+                    continue
+
+                failures = await self.run_program(program, run_tool)
+                self.last_action = None
+                pending = [p for p in self.scratchpad.plan if p.status in ("pending", "failed")]
+                if failures:
+                    self.retry_hint = "Some calls failed: " + "; ".join(
+                        f"{c.tool} -> {str(r)[:120]}" for c, r in failures
+                    ) + ". Fix them and continue with the remaining plan."
+                elif ask_call:
+                    self.retry_hint = None
+                    self.scratchpad.meta.status = "awaiting_user_input"
+                    self.scratchpad.ui_action = UIAction(
+                        type="prompt",
+                        title="Input Needed",
+                        message=ask_call.args.get("question", "Continue?"),
+                        options=["Yes", "No"]
+                    )
+                elif pending:
+                    self.retry_hint = "Continue with the next pending plan item."
+                else:
+                    self.retry_hint = None
+                    self.scratchpad.user_interaction.last_user_response = None
+                save_scratchpad(self.scratchpad)
+
             # --- SMART PARSER ---
             # Robustly capture the first function-call block
-            function_match = re.search(r'<start_function_call>\s*call:([\w_]+)\s*(\{.*?\})\s*<end_function_call>', raw_output, re.DOTALL)
+            function_match = None if ran_program else re.search(r'<start_function_call>\s*call:([\w_]+)\s*(\{.*?\})\s*<end_function_call>', raw_output, re.DOTALL)
             
             if function_match:
                 tool_name = function_match.group(1)
@@ -141,10 +328,9 @@ class AgentKernel:
                     print(f"Tool '{tool_name}' is not allowed right now. Retrying...")
                     self.scratchpad.meta.iteration_count += 1
                     # Nudge the model away from the forbidden tool without changing user intent
-                    self.scratchpad.user_interaction.last_user_response = (
-                        (self.scratchpad.user_interaction.last_user_response or "")
-                        + "\n\nIMPORTANT: You must only call a tool from AVAILABLE TOOLS. "
-                        + "Do NOT call the forbidden tool."
+                    self.retry_hint = (
+                        "You must only call a tool from AVAILABLE TOOLS. "
+                        f"Do NOT call {tool_name}."
                     )
                     save_scratchpad(self.scratchpad)
                     await asyncio.sleep(0.2)
@@ -170,44 +356,19 @@ class AgentKernel:
                     save_scratchpad(self.scratchpad)
                     break
 
-                # Intent alignment / correction based on user text
-                raw_request = self.scratchpad.user_interaction.last_user_response or ""
-                user_request = raw_request.lower().strip()
+                # Program annotations mean nothing for a lone call
+                if isinstance(args, dict):
+                    args.pop(AFTER_KEY, None)
+                    args.pop(PLAN_KEY, None)
 
+                # Intent alignment / correction based on user text
                 if tool_name == "mac_open_app":
-                    # Require explicit open intent; otherwise hard-block
-                    open_intents = ["open", "launch", "start", "run"]
-                    if not any(word in user_request for word in open_intents):
+                    if not self._align_app_name(args):
                         print("App open rejected: no open intent detected. Stopping.")
                         self.scratchpad.meta.status = "completed"
                         self.scratchpad.user_interaction.last_user_response = None
                         save_scratchpad(self.scratchpad)
                         break
-                    # Align app_name with user intent when the model defaults incorrectly (e.g., Safari)
-                    app_map = {
-                        "notes": "Notes",
-                        "note": "Notes",
-                        "safari": "Safari",
-                        "chrome": "Google Chrome",
-                        "google chrome": "Google Chrome",
-                        "finder": "Finder",
-                        "terminal": "Terminal",
-                        "iterm": "iTerm",
-                        "calendar": "Calendar",
-                        "spotify": "Spotify"
-                    }
-                    resolved_app = None
-                    for key, app in app_map.items():
-                        if key in user_request:
-                            resolved_app = app
-                            break
-                    # Heuristic: if the user says "open X" then take X as app name (title-cased)
-                    if not resolved_app and user_request.startswith("open "):
-                        candidate = raw_request.split(" ", 1)[1].strip()
-                        if candidate:
-                            resolved_app = candidate.title()
-                    if resolved_app:
-                        args["app_name"] = resolved_app
                 else:
                     # reset rejection counter when tool changes away from mac_open_app
                     self.reject_count = 0
@@ -216,25 +377,10 @@ class AgentKernel:
 
                 # Validate common placeholders / missing args
                 if tool_name == "fs_read":
-                    path = (args or {}).get("path")
-                    if not isinstance(path, str) or not path or path.strip() in {"file.txt", "path/to/file", "your_file.txt"}:
+                    prompt = self._check_fs_read(args)
+                    if prompt:
                         self.scratchpad.meta.status = "awaiting_user_input"
-                        self.scratchpad.ui_action = UIAction(
-                            type="prompt",
-                            title="Input Needed",
-                            message="Which file path should I read? (e.g., backend/runtime/model.py)",
-                            options=[]
-                        )
-                        save_scratchpad(self.scratchpad)
-                        continue
-                    if not os.path.exists(path):
-                        self.scratchpad.meta.status = "awaiting_user_input"
-                        self.scratchpad.ui_action = UIAction(
-                            type="prompt",
-                            title="File Not Found",
-                            message=f"File not found: {path}. Provide an existing path.",
-                            options=[]
-                        )
+                        self.scratchpad.ui_action = prompt
                         save_scratchpad(self.scratchpad)
                         continue
 
@@ -257,25 +403,21 @@ class AgentKernel:
                 
                 else:
                     if hasattr(self.tools, tool_name):
-                        method = getattr(self.tools, tool_name)
-                        try:
-                            result = await asyncio.wait_for(method(**args), timeout=10)
-                        except asyncio.TimeoutError:
-                            result = {"error": "tool_timeout"}
+                        result = await run_tool(tool_name, args)
                         
-                        self.scratchpad.steps.append(Step(
-                            step_id=len(self.scratchpad.steps)+1,
+                        self.scratchpad.steps.append(
                             phase="execution",
                             action=tool_name,
                             arguments=args,
                             result=str(result)
-                        ))
+                        )
                         # After any tool, clear user input; keep loop active only if still active
                         self.last_action = (tool_name, args)
+                        self.retry_hint = None
                         self.scratchpad.user_interaction.last_user_response = None
                         save_scratchpad(self.scratchpad)
             
-            else:
+            elif not ran_program:
                 # 4. Check for "Done" condition
                 if "done" in raw_output.lower() or "task completed" in raw_output.lower():
                     self.scratchpad.meta.status = "completed"
@@ -1,14 +1,7 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, field_serializer, field_validator
 from typing import List, Optional, Any, Dict
 from datetime import datetime
-
-class Step(BaseModel):
-    step_id: int
-    phase: str
-    action: Optional[str] = None
-    arguments: Optional[Dict] = None
-    result: Optional[str] = None
-    timestamp: str = Field(default_factory=lambda: datetime.now().isoformat())
+from core.steplog import Step, StepLog
 
 class PlanItem(BaseModel):
     id: int
@@ -36,11 +29,23 @@ class ScratchpadMeta(BaseModel):
     iteration_count: int = 0
 
 class Scratchpad(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     meta: ScratchpadMeta
     user_interaction: UserInteraction = Field(default_factory=UserInteraction)
     ui_action: UIAction = Field(default_factory=UIAction)
     plan: List[PlanItem] = []
     knowledge_state: KnowledgeState = Field(default_factory=KnowledgeState)
-    steps: List[Step] = []
+    # Kept outside Pydantic validation; see core.steplog
+    steps: StepLog = Field(default_factory=StepLog)
     artifacts: List[Dict] = []
-    final_output: Optional[Dict] = None
\ No newline at end of file
+    final_output: Optional[Dict] = None
+
+    @field_validator("steps", mode="before")
+    @classmethod
+    def _coerce_steps(cls, v):
+        return v if isinstance(v, StepLog) else StepLog.from_list(v or [])
+
+    @field_serializer("steps")
+    def _serialize_steps(self, steps: StepLog):
+        return steps.to_list()
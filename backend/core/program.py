@@ -0,0 +1,108 @@
+import ast
+import asyncio
+import json
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+CALL_RE = re.compile(r'<start_function_call>\s*call:([\w_]+)\s*(\{.*?\})\s*<end_function_call>', re.DOTALL)
+
+# Reserved argument keys; stripped before the tool is called
+AFTER_KEY = "_after"  # 1-based numbers of the blocks this call waits for
+PLAN_KEY = "_plan"    # PlanItem.id this call completes
+
+
+class ProgramCall:
+    __slots__ = ("index", "tool", "args", "after", "plan_id")
+
+    def __init__(self, index: int, tool: str, args: Dict, after: List[int], plan_id: Optional[int]):
+        self.index = index
+        self.tool = tool
+        self.args = args
+        self.after = after
+        self.plan_id = plan_id
+
+
+def parse_args(args_str: str) -> Dict:
+    # Normalize any escaped-brace artifacts the model might copy from examples
+    args_str = args_str.replace('{"{"}', '{').replace('{"}"}', '}')
+    try:
+        args = json.loads(args_str)
+    except json.JSONDecodeError:
+        args = ast.literal_eval(args_str)
+    if not isinstance(args, dict):
+        raise ValueError("arguments must be an object")
+    return args
+
+
+def parse_program(raw_output: str) -> List[ProgramCall]:
+    """
+    Parses every function-call block in the model output into a dependency graph.
+    A block without "_after" waits for the block before it; a block with "_after"
+    waits only for the earlier blocks it lists ([] = none). update_plan blocks are
+    hoisted: they wait only for earlier update_plan blocks, and every other block
+    waits for all of them, wherever they appear.
+    Raises ValueError/SyntaxError on unparseable arguments.
+    """
+    calls = []
+    for idx, m in enumerate(CALL_RE.finditer(raw_output), start=1):
+        args = parse_args(m.group(2))
+        after = args.pop(AFTER_KEY, None)
+        plan_id = args.pop(PLAN_KEY, None)
+        if isinstance(after, int):
+            after = [after]
+        calls.append(ProgramCall(idx, m.group(1), args, after, plan_id if isinstance(plan_id, int) else None))
+
+    plan_blocks = [c.index for c in calls if c.tool == "update_plan"]
+    for c in calls:
+        if c.after is None:
+            deps = {c.index - 1} if c.index > 1 else set()
+        else:
+            # Only earlier blocks may be referenced, which keeps the graph acyclic
+            deps = {d for d in c.after if isinstance(d, int) and 0 < d < c.index}
+        if c.tool != "update_plan":
+            # Including later ones, so no call binds PlanItems from the old plan
+            deps.update(plan_blocks)
+        else:
+            deps = {d for d in deps if d in plan_blocks}
+        c.after = sorted(deps)
+    return calls
+
+
+def call_failed(result: Any) -> bool:
+    return isinstance(result, dict) and "error" in result
+
+
+async def execute_program(
+    calls: List[ProgramCall],
+    run_tool: Callable[[str, Dict], Awaitable[Any]],
+    on_start: Callable[[ProgramCall], None],
+    on_done: Callable[[ProgramCall, Any, bool], None],
+    on_skip: Callable[[ProgramCall], None],
+) -> Dict[int, Optional[bool]]:
+    """
+    Runs the calls as a DAG: each starts as soon as its dependencies succeed, so
+    independent calls overlap. Dependents of a failed call are skipped.
+    Returns {block index: True (ok) / False (failed) / None (skipped)}.
+    """
+    tasks: Dict[int, asyncio.Task] = {}
+
+    async def run(call: ProgramCall) -> Optional[bool]:
+        if call.after:
+            outcomes = await asyncio.gather(*(tasks[d] for d in call.after))
+            if not all(outcomes):
+                on_skip(call)
+                return None
+        on_start(call)
+        try:
+            result = await run_tool(call.tool, call.args)
+        except Exception as e:
+            result = {"error": str(e)}
+        ok = not call_failed(result)
+        on_done(call, result, ok)
+        return ok
+
+    # A task looks its dependencies up only once it runs, by which time all exist
+    for call in calls:
+        tasks[call.index] = asyncio.ensure_future(run(call))
+    outcomes = await asyncio.gather(*tasks.values())
+    return dict(zip(tasks.keys(), outcomes))
@@ -8,11 +8,16 @@ def ensure_dir():
     if not os.path.exists(SESSION_DIR):
         os.makedirs(SESSION_DIR)
 
+def dump_scratchpad_json(pad: Scratchpad) -> str:
+    """Same schema as model_dump_json, but steps come from the step log's encoded cache."""
+    head = pad.model_dump_json(exclude={"steps"})
+    return f'{head[:-1]},"steps":{pad.steps.to_json()}}}'
+
 def save_scratchpad(pad: Scratchpad):
     ensure_dir()
     path = os.path.join(SESSION_DIR, f"{pad.meta.session_id}.json")
     with open(path, "w") as f:
-        f.write(pad.model_dump_json(indent=2))
+        f.write(dump_scratchpad_json(pad))
 
 def load_scratchpad(session_id: str) -> Scratchpad:
     ensure_dir()
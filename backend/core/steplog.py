@@ -0,0 +1,108 @@
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+
+
+def _dumps(obj: Any) -> str:
+    # default=str keeps odd tool arguments (paths, sets, ...) from breaking a push;
+    # OPT_NON_STR_KEYS matches the stdlib for literal_eval'd args like {1: "a"}
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(obj, default=str, separators=(",", ":"))
+
+
+class Step:
+    """One executed action. Timestamps stay a float until the step is first encoded."""
+    __slots__ = ("step_id", "phase", "action", "arguments", "result", "_ts")
+
+    def __init__(self, step_id: int, phase: str, action: Optional[str] = None,
+                 arguments: Optional[Dict] = None, result: Optional[str] = None,
+                 timestamp: Any = None):
+        self.step_id = step_id
+        self.phase = phase
+        self.action = action
+        self.arguments = arguments
+        self.result = result
+        self._ts = time.time() if timestamp is None else timestamp
+
+    @property
+    def timestamp(self) -> str:
+        if isinstance(self._ts, str):
+            return self._ts
+        return datetime.fromtimestamp(self._ts).isoformat()
+
+    def to_dict(self) -> Dict:
+        return {
+            "step_id": self.step_id,
+            "phase": self.phase,
+            "action": self.action,
+            "arguments": self.arguments,
+            "result": self.result,
+            "timestamp": self.timestamp,
+        }
+
+
+class StepLog:
+    """
+    Append-only step history. Each step is encoded to JSON once, the first time the
+    log is serialized after it was appended; later dumps only encode the new tail.
+    """
+    __slots__ = ("_steps", "_fragments", "_body", "_body_len")
+
+    def __init__(self, steps: Iterable[Step] = ()):
+        self._steps: List[Step] = list(steps)
+        self._fragments: List[str] = []
+        self._body = ""
+        self._body_len = 0
+
+    def append(self, phase: str, action: Optional[str] = None,
+               arguments: Optional[Dict] = None, result: Optional[str] = None) -> Step:
+        step = Step(len(self._steps) + 1, phase, action, arguments, result)
+        self._steps.append(step)
+        return step
+
+    def __len__(self) -> int:
+        return len(self._steps)
+
+    def __iter__(self):
+        return iter(self._steps)
+
+    def __getitem__(self, idx):
+        return self._steps[idx]
+
+    def to_list(self) -> List[Dict]:
+        return [s.to_dict() for s in self._steps]
+
+    def to_json(self) -> str:
+        """Returns the steps as a JSON array, encoding only steps not yet cached."""
+        if len(self._fragments) < len(self._steps):
+            new = [_dumps(s.to_dict()) for s in self._steps[len(self._fragments):]]
+            self._fragments.extend(new)
+        if self._body_len < len(self._fragments):
+            tail = ",".join(self._fragments[self._body_len:])
+            self._body = f"{self._body},{tail}" if self._body else tail
+            self._body_len = len(self._fragments)
+        return f"[{self._body}]"
+
+    @classmethod
+    def from_list(cls, items: Iterable[Any]) -> "StepLog":
+        steps = []
+        for item in items:
+            if isinstance(item, Step):
+                steps.append(item)
+            else:
+                steps.append(Step(
+                    step_id=item["step_id"],
+                    phase=item["phase"],
+                    action=item.get("action"),
+                    arguments=item.get("arguments"),
+                    result=item.get("result"),
+                    timestamp=item.get("timestamp"),
+                ))
+        return cls(steps)
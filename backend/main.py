@@ -7,7 +7,7 @@ from core.kernel import AgentKernel
 from core.scratchpad import load_scratchpad
 from tools.tools import ToolRegistry
 from runtime.voice import transcribe_audio
-from core.scratchpad import save_scratchpad
+from core.scratchpad import save_scratchpad, dump_scratchpad_json
 kernel = None
 
 @asynccontextmanager
@@ -45,7 +45,7 @@ async def websocket_endpoint(websocket: WebSocket):
     print("WS: Connected to client")
     
     try:
-        await websocket.send_text(kernel.scratchpad.model_dump_json())
+        await websocket.send_text(dump_scratchpad_json(kernel.scratchpad))
         
         last_step_count = 0 # Track changes
         
@@ -57,12 +57,17 @@ async def websocket_endpoint(websocket: WebSocket):
             # ONLY SEND IF DATA CHANGED
             if current_steps != last_step_count:
                 print(f"WS: State Changed! Sending update ({current_steps} steps)...")
-                await websocket.send_text(kernel.scratchpad.model_dump_json())
+                await websocket.send_text(dump_scratchpad_json(kernel.scratchpad))
                 last_step_count = current_steps
             
     except Exception as e:
         print(f"WS Error/Disconnect: {e}")
 
+@app.get("/tools/stats")
+async def tool_stats():
+    # Per-tool queue depth, running count, timeouts and utilization
+    return kernel.tools.executor.stats()
+
 @app.post("/input")
 async def handle_user_input(data: dict):
     response = data.get("response")
@@ -74,6 +79,8 @@ async def handle_user_input(data: dict):
         current_inter.last_user_response = response
         # 3. Save back to scratchpad
         kernel.scratchpad.user_interaction = current_inter
+        # A stale retry hint from the previous request must not leak into this one
+        kernel.retry_hint = None
         save_scratchpad(kernel.scratchpad)
         
         # 4. Optional: Kick the queue too (legacy, but good for safety)
@@ -0,0 +1,141 @@
+import json
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from core.models import Scratchpad
+
+# Hard cap on prompt length; keeps CPU prefill cost flat however long the session runs
+PROMPT_TOKEN_BUDGET = 2048
+# Longest slice of the user request that is kept, and the least it is clipped to
+USER_REQUEST_TOKENS = 512
+MIN_USER_REQUEST_TOKENS = 64
+# Longest retry hint that is kept
+HINT_TOKENS = 128
+# The newest steps are shown with their results; older ones as one-line summaries
+RECENT_STEPS_FULL = 3
+FULL_RESULT_CHARS = 600
+SUMMARY_RESULT_CHARS = 80
+# Entries kept in the per-segment token cache
+MAX_CACHED_SEGMENTS = 4096
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "...[truncated]"
+
+
+def _render_step(step, full: bool) -> str:
+    args = json.dumps(step.arguments or {}, default=str)
+    result = step.result or ""
+    if full:
+        return f"[step {step.step_id}] {step.action} {args}\n-> {_clip(result, FULL_RESULT_CHARS)}\n"
+    return f"[step {step.step_id}] {step.action} {_clip(args, SUMMARY_RESULT_CHARS)} -> {_clip(result, SUMMARY_RESULT_CHARS)}\n"
+
+
+class ContextBuilder:
+    """
+    Assembles the prompt as token ids from independently tokenized segments.
+    Static text and each step's rendering are tokenized once and cached, so a new
+    iteration only pays for segments that changed.
+    """
+
+    def __init__(self, tokenizer, budget: int = PROMPT_TOKEN_BUDGET):
+        self.tokenizer = tokenizer
+        self.budget = budget
+        self._cache: "OrderedDict[tuple, List[int]]" = OrderedDict()
+        self._prefix_ids = tokenizer("", add_special_tokens=True)["input_ids"]
+        self.last_stats: Dict[str, int] = {}
+        self._hits = 0
+        self._misses = 0
+
+    def _encode(self, key: tuple, render: Callable[[], str]) -> List[int]:
+        ids = self._cache.get(key)
+        if ids is not None:
+            self._cache.move_to_end(key)
+            self._hits += 1
+            return ids
+        ids = self.tokenizer(render(), add_special_tokens=False)["input_ids"]
+        self._cache[key] = ids
+        if len(self._cache) > MAX_CACHED_SEGMENTS:
+            self._cache.popitem(last=False)
+        self._misses += 1
+        return ids
+
+    def _encode_text(self, text: str) -> List[int]:
+        return self._encode(("text", text), lambda: text)
+
+    def build(self, scratchpad: Scratchpad, head: str, user_intent: str, tail: str,
+              hint: Optional[str] = None) -> List[int]:
+        self._hits = 0
+        self._misses = 0
+
+        head_ids = self._encode_text(head)
+        tail_ids = self._encode_text(tail)
+        user_ids = self._encode_text(f"USER REQUEST:\n{user_intent}\n")
+        if len(user_ids) > USER_REQUEST_TOKENS:
+            user_ids = user_ids[:USER_REQUEST_TOKENS] + self._encode_text("...[truncated]\n")
+        hint_ids = self._encode_text(f"NOTE: {hint}\n")[:HINT_TOKENS] if hint else []
+
+        # Head and tail (system prompt, tool list, instructions) are never cut; if the
+        # rest doesn't fit, the hint goes first, then the user request down to its floor
+        fixed = len(self._prefix_ids) + len(head_ids) + len(tail_ids)
+        overflow = fixed + len(user_ids) + len(hint_ids) - self.budget
+        if overflow > 0:
+            cut = min(overflow, len(hint_ids))
+            hint_ids = hint_ids[:len(hint_ids) - cut]
+            overflow -= cut
+        if overflow > 0:
+            user_ids = user_ids[:max(MIN_USER_REQUEST_TOKENS, len(user_ids) - overflow)]
+        over_budget = fixed + len(user_ids) + len(hint_ids) > self.budget
+        if over_budget:
+            print(f"WARNING: fixed prompt segments ({fixed + len(user_ids)} tokens) exceed "
+                  f"PROMPT_TOKEN_BUDGET ({self.budget}); shorten the system prompt or tool list.")
+
+        remaining = self.budget - fixed - len(user_ids) - len(hint_ids)
+
+        plan_ids: List[int] = []
+        if scratchpad.plan and remaining > 0:
+            plan_text = "PLAN:\n" + "".join(f"{p.id}. [{p.status}] {p.description}\n" for p in scratchpad.plan)
+            plan_ids = self._encode_text(plan_text)
+            if len(plan_ids) > remaining // 2:
+                plan_ids = plan_ids[:remaining // 2]
+            remaining -= len(plan_ids)
+
+        # Newest first, so the budget is spent on what the model most likely needs
+        step_chunks: List[List[int]] = []
+        steps = scratchpad.steps
+        header_ids = self._encode_text("RECENT STEPS:\n") if len(steps) else []
+        remaining -= len(header_ids)
+        shown = 0
+        for idx in range(len(steps) - 1, -1, -1):
+            if remaining <= 0:
+                break
+            step = steps[idx]
+            full = shown < RECENT_STEPS_FULL
+            ids = self._encode(("step", step.step_id, step.timestamp, full), lambda: _render_step(step, full))
+            if len(ids) > remaining:
+                if not full:
+                    break
+                ids = self._encode(("step", step.step_id, step.timestamp, False), lambda: _render_step(step, False))
+                if len(ids) > remaining:
+                    break
+            step_chunks.append(ids)
+            remaining -= len(ids)
+            shown += 1
+
+        ids = list(self._prefix_ids) + head_ids + plan_ids
+        if step_chunks:
+            ids += header_ids
+            for chunk in reversed(step_chunks):
+                ids += chunk
+        ids += user_ids + hint_ids + tail_ids
+
+        self.last_stats = {
+            "prompt_tokens": len(ids),
+            "steps_shown": shown,
+            "steps_total": len(steps),
+            "segments_cached": self._hits,
+            "segments_tokenized": self._misses,
+            "over_budget": over_budget,
+        }
+        return ids
@@ -4,16 +4,18 @@ import torch
 import re
 from transformers import AutoTokenizer, AutoModelForCausalLM
 from core.models import Scratchpad
-from runtime.prompts import AETHEL_SYSTEM_PROMPT
+from runtime.prompts import AETHEL_SYSTEM_PROMPT, PROGRAM_ORDER_RULE
+from runtime.context import ContextBuilder
 
 LOCAL_MODEL_PATH = os.path.join(os.path.dirname(__file__), "../model")
 DEVICE = "mps" if torch.backends.mps.is_available() else "cpu"
 
 tokenizer = None
 model = None
+context_builder = None
 
 def load_model():
-    global tokenizer, model
+    global tokenizer, model, context_builder
 
     if not os.path.exists(LOCAL_MODEL_PATH):
         raise FileNotFoundError(f"Model not found at {os.path.abspath(LOCAL_MODEL_PATH)}.")
@@ -37,53 +39,64 @@ def load_model():
         trust_remote_code=True
     )
 
+    context_builder = ContextBuilder(tokenizer)
+
     print("Model loaded successfully.")
 
-def _extract_first_function_call(text: str) -> str:
+def _extract_function_calls(text: str) -> str:
     """
-    Returns the first <start_function_call>...</end_function_call> block if present,
-    otherwise returns the original text trimmed.
+    Returns every <start_function_call>...</end_function_call> block (one per line) if
+    present, otherwise returns the original text trimmed.
     """
-    m = re.search(r"<start_function_call>.*?<end_function_call>", text, flags=re.DOTALL)
-    return m.group(0).strip() if m else text.strip()
+    blocks = re.findall(r"<start_function_call>.*?<end_function_call>", text, flags=re.DOTALL)
+    return "\n".join(b.strip() for b in blocks) if blocks else text.strip()
 
-def generate_response(scratchpad: Scratchpad, tools_list_str: str):
+def generate_response(scratchpad: Scratchpad, tools_list_str: str, hint: str | None = None):
     user_intent = scratchpad.user_interaction.last_user_response or "No input."
 
-    # Force the model to return a single, valid JSON function call.
-    prompt = f"""
+    # Force the model to return valid JSON function calls only.
+    head = f"""
 {AETHEL_SYSTEM_PROMPT}
 
 AVAILABLE TOOLS:
 {tools_list_str}
 
-USER REQUEST:
-{user_intent}
-
+"""
+    tail = """
 INSTRUCTION (STRICT):
-- Reply with exactly ONE function call block.
+- Reply with one function call block, or several to run a multi-step plan at once.
+- """ + PROGRAM_ORDER_RULE + """
 - Use only a tool name from AVAILABLE TOOLS.
 - Arguments MUST be valid JSON (double quotes for keys/strings).
-- If there are no arguments, use an empty object: {{}}.
+- If there are no arguments, use an empty object: {}.
 - Never output placeholders like arg/value/tool_name; use real parameter names and values.
-- Output NOTHING except the function call block.
+- Output NOTHING except function call blocks.
 
 Example format:
-<start_function_call>call:fs_read{{"path": "file.txt"}}<end_function_call>
+<start_function_call>call:fs_read{"path": "file.txt"}<end_function_call>
 
 Assistant:
 """
 
-    inputs = tokenizer(prompt, return_tensors="pt").to(DEVICE)
+    # Plan + recent step results, packed within the prompt token budget
+    prompt_ids = context_builder.build(scratchpad, head, user_intent, tail, hint=hint)
+    stats = context_builder.last_stats
+    print(f"Prompt tokens: {stats['prompt_tokens']} "
+          f"(steps {stats['steps_shown']}/{stats['steps_total']}, "
+          f"segments cached {stats['segments_cached']}, tokenized {stats['segments_tokenized']})")
+
+    input_ids = torch.tensor([prompt_ids], dtype=torch.long, device=DEVICE)
+    inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
 
     with torch.no_grad():
         outputs = model.generate(
             **inputs,
-            max_new_tokens=128,
+            max_new_tokens=384,
             do_sample=False,
             eos_token_id=tokenizer.eos_token_id,
             pad_token_id=tokenizer.eos_token_id,
         )
 
-    decoded = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    return _extract_first_function_call(decoded)
\ No newline at end of file
+    # Decode only the reply; the echoed prompt holds the tail's own example block
+    decoded = tokenizer.decode(outputs[0][len(prompt_ids):], skip_special_tokens=True)
+    return _extract_function_calls(decoded)
\ No newline at end of file
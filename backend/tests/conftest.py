@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Tests import backend modules the way main.py does (core.*, tools.*, runtime.*)
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
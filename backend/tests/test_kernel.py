@@ -0,0 +1,68 @@
+import asyncio
+import sys
+import types
+
+from core.kernel import AgentKernel
+from tools.tools import ToolRegistry
+
+
+def _fake_model(replies):
+    # Stands in for runtime.model (torch + weights); hands out one reply per generation
+    module = types.ModuleType("runtime.model")
+    module.calls = 0
+
+    def generate_response(scratchpad, tools_list_str, hint=None):
+        module.calls += 1
+        return replies[min(module.calls, len(replies)) - 1]
+
+    module.generate_response = generate_response
+    return module
+
+
+async def _run_until(kernel, done, timeout=5.0):
+    task = asyncio.ensure_future(kernel.run_loop())
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not done() and not task.done() and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def test_one_block_reply_runs_as_single_call(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    model = _fake_model(['<start_function_call>call:fs_mkdir{"path": "demo"}<end_function_call>'])
+    monkeypatch.setitem(sys.modules, "runtime.model", model)
+
+    kernel = AgentKernel("test-session", ToolRegistry(None))
+    kernel.scratchpad.user_interaction.last_user_response = "make a folder called demo"
+
+    asyncio.run(_run_until(kernel, lambda: len(kernel.scratchpad.steps) > 0))
+
+    assert (tmp_path / "demo").is_dir()
+    assert [s.action for s in kernel.scratchpad.steps] == ["fs_mkdir"]
+    assert kernel.scratchpad.meta.status == "active"
+    assert kernel.scratchpad.ui_action.type != "prompt"
+    assert model.calls == 1
+
+
+def test_blocks_before_ask_user_run_without_a_later_update_plan(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    model = _fake_model(["\n".join([
+        '<start_function_call>call:fs_mkdir{"path": "demo"}<end_function_call>',
+        '<start_function_call>call:ask_user{"question": "Write the README too?"}<end_function_call>',
+        '<start_function_call>call:update_plan{"plan": ["mkdir", "readme"]}<end_function_call>',
+    ])])
+    monkeypatch.setitem(sys.modules, "runtime.model", model)
+
+    kernel = AgentKernel("test-session", ToolRegistry(None))
+    kernel.scratchpad.user_interaction.last_user_response = "make a folder called demo"
+
+    asyncio.run(_run_until(kernel, lambda: kernel.scratchpad.meta.status == "awaiting_user_input"))
+
+    assert (tmp_path / "demo").is_dir()
+    assert [s.action for s in kernel.scratchpad.steps] == ["fs_mkdir"]
+    assert kernel.scratchpad.ui_action.message == "Write the README too?"
+    assert kernel.scratchpad.plan == []
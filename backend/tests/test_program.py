@@ -0,0 +1,28 @@
+import asyncio
+
+from core.program import execute_program, parse_program
+
+
+def _block(tool, args):
+    return f"<start_function_call>call:{tool}{args}<end_function_call>"
+
+
+def test_update_plan_is_hoisted_ahead_of_earlier_blocks():
+    calls = parse_program("\n".join([
+        _block("fs_read", '{"path": "a.txt"}'),
+        _block("update_plan", '{"plan": ["read a", "write b"]}'),
+        _block("fs_write", '{"path": "b.txt", "content": "b", "_after": []}'),
+    ]))
+    assert [c.after for c in calls] == [[2], [], [2]]
+
+    started = []
+
+    async def run_tool(tool, args):
+        started.append(tool)
+        await asyncio.sleep(0)
+        return {}
+
+    outcomes = asyncio.run(execute_program(calls, run_tool, lambda c: None, lambda c, r, ok: None, lambda c: None))
+
+    assert outcomes == {1: True, 2: True, 3: True}
+    assert started[0] == "update_plan"
@@ -0,0 +1,84 @@
+import asyncio
+import os
+from dataclasses import replace
+
+from core.kernel import AgentKernel
+from core.program import call_failed
+from tools.executor import TOOL_POLICIES
+from tools.tools import ToolRegistry
+
+
+def test_batch_write_with_failed_item_is_a_failed_call(tmp_path):
+    tools = ToolRegistry(None)
+    blocker = tmp_path / "blocker"
+    blocker.write_text("not a folder")
+
+    out = asyncio.run(tools.fs_write_many([
+        {"path": str(blocker / "a.txt"), "content": "a"},
+        {"path": str(tmp_path / "b.txt"), "content": "b"},
+    ]))
+
+    assert call_failed(out)
+    assert out["error"] == "partial_failure"
+    assert (out["failed"], out["succeeded"]) == (1, 1)
+    assert "error" in out["results"][0] and "error" not in out["results"][1]
+
+
+def test_batch_read_without_failures_is_ok(tmp_path):
+    tools = ToolRegistry(None)
+    (tmp_path / "a.txt").write_text("hello")
+
+    out = asyncio.run(tools.fs_read_many([str(tmp_path / "a.txt")]))
+
+    assert not call_failed(out)
+    assert out["results"] == [{"path": str(tmp_path / "a.txt"), "content": "hello"}]
+
+
+def test_read_range_rejects_inverted_window(tmp_path):
+    tools = ToolRegistry(None)
+    path = tmp_path / "big.txt"
+    path.write_text("".join(f"line {i}\n" for i in range(1, 20_001)))
+
+    out = asyncio.run(tools.fs_read_range(str(path), start_line=10, end_line=5))
+
+    assert out == {"error": "invalid_range", "start_line": 10, "end_line": 5}
+    ok = asyncio.run(tools.fs_read_range(str(path), start_line=10, end_line=10))
+    assert ok["content"] == "line 10\n" and ok["end_line"] == 10 and "truncated" not in ok
+
+
+def test_kg_grep_scans_everything_until_trigrams_are_built(tmp_path):
+    (tmp_path / "a.py").write_text("import asyncio\n")
+    (tmp_path / "b.py").write_text("import os\n")
+    tools = AgentKernel("test-session", ToolRegistry(None)).tools
+
+    async def run():
+        indexed = await tools.index_folder(str(tmp_path))
+        before = await tools.kg_grep("import asyncio")
+        await tools._trigram_build
+        after = await tools.kg_grep("import asyncio")
+        return indexed, before, after
+
+    indexed, before, after = asyncio.run(run())
+
+    assert indexed["files_indexed"] == 2
+    assert before["trigram_index"] == "building" and before["files_scanned"] == 2
+    assert "trigram_index" not in after and after["files_scanned"] == 1
+    assert [r["path"] for r in before["results"]] == [r["path"] for r in after["results"]] == [str(tmp_path / "a.py")]
+
+
+def test_write_blocked_on_fifo_is_killed_at_the_timeout(tmp_path):
+    fifo = tmp_path / "pipe"
+    os.mkfifo(fifo)
+    tools = ToolRegistry(None)
+    tools.executor.policies = {**TOOL_POLICIES, "fs_write": replace(TOOL_POLICIES["fs_write"], timeout=0.5)}
+
+    async def run():
+        blocked = await tools.executor.run("fs_write", {"path": str(fifo), "content": "x"})
+        after = await tools.executor.run("fs_write", {"path": str(tmp_path / "a.txt"), "content": "a"})
+        return blocked, after
+
+    blocked, after = asyncio.run(run())
+
+    assert blocked == {"error": "tool_timeout"}
+    assert after == {"status": "success"}
+    assert tools.executor.stats()["orphaned_threads"] == 0
@@ -0,0 +1,22 @@
+import re
+
+from tools.trigram import TrigramIndex, build_postings
+
+
+def _index(*texts):
+    docs = [{"path": str(i), "content": t} for i, t in enumerate(texts)]
+    return TrigramIndex(docs, build_postings(docs))
+
+
+def test_ignore_case_narrowing_keeps_chars_re_folds_to_ascii():
+    index = _index("İstanbul", "ſtrasse", "nothing here")
+
+    assert index.candidates("(?i)istanbul", re.MULTILINE) == {0}
+    assert index.candidates("STRASSE", re.MULTILINE | re.IGNORECASE) == {1}
+
+
+def test_non_ascii_literals_only_narrow_case_sensitive_queries():
+    index = _index("Café Crème", "CAFÉ CRÈME")
+
+    assert index.candidates("Café", re.MULTILINE) == {0}
+    assert index.candidates("(?i)café", re.MULTILINE) == {0, 1}
@@ -0,0 +1,245 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import forkserver, spawn
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows; limits are then skipped
+    resource = None
+
+
+@dataclass(frozen=True)
+class ToolPolicy:
+    # "thread": blocking helpers run on the shared pool (a timeout abandons the thread)
+    # "process": blocking helpers run in a child process that is killed on timeout
+    isolation: str = "thread"
+    max_concurrency: int = 4
+    timeout: float = 10
+    cpu_seconds: Optional[int] = None   # process isolation only
+    memory_mb: Optional[int] = None     # process isolation only
+
+
+DEFAULT_POLICY = ToolPolicy()
+# Reads (fs_read, fs_read_range, fs_read_many) keep the thread default: they only open
+# regular files, so just a stalled mount can hang one, and that thread is then left to
+# finish on its own (see stats()["orphaned_threads"]). Writes can block on a FIFO or a
+# stalled mount too, so they run in processes the timeout kills.
+TOOL_POLICIES: Dict[str, ToolPolicy] = {
+    "ask_user": ToolPolicy(max_concurrency=1),
+    "update_plan": ToolPolicy(max_concurrency=1),
+    "index_folder": ToolPolicy(isolation="process", max_concurrency=1, timeout=30, cpu_seconds=30, memory_mb=2048),
+    "fs_write": ToolPolicy(isolation="process", cpu_seconds=10, memory_mb=256),
+    "fs_write_many": ToolPolicy(isolation="process", max_concurrency=2, cpu_seconds=10, memory_mb=512),
+    "fs_mkdir": ToolPolicy(isolation="process", cpu_seconds=10, memory_mb=256),
+    "fs_move": ToolPolicy(isolation="process", max_concurrency=2, cpu_seconds=10, memory_mb=256),
+    "kg_grep": ToolPolicy(isolation="process", max_concurrency=2, cpu_seconds=10, memory_mb=1024),
+    # Not a tool: the background trigram build index_folder starts for kg_grep
+    "kg_grep_index": ToolPolicy(isolation="process", timeout=300, cpu_seconds=300, memory_mb=2048),
+    "mac_open_app": ToolPolicy(max_concurrency=1),
+    "search_web": ToolPolicy(max_concurrency=2),
+}
+
+
+class ToolProcessError(Exception):
+    pass
+
+
+def _process_context():
+    # Never fork the server itself: the child would inherit the loaded model (so
+    # RLIMIT_AS would measure that, not the tool) plus locks held by torch/pool threads.
+    # A forkserver forks from a small fresh interpreter; spawn is the fallback.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["tools.worker"])
+        _start_forkserver()
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def _start_forkserver():
+    # The server imports its preload before it learns our sys.path, and tools.worker
+    # needs the server's main path/name; both go through the environment of this one
+    # launch only, so other subprocesses (ffmpeg, open) don't inherit them
+    from tools.worker import MAIN_ENV
+    backend_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    main_keys = ("init_main_from_name", "init_main_from_path")
+    main = {k: v for k, v in spawn.get_preparation_data("tools").items() if k in main_keys}
+    env = {
+        "PYTHONPATH": os.pathsep.join(p for p in (backend_root, os.environ.get("PYTHONPATH")) if p),
+        MAIN_ENV: json.dumps(main),
+    }
+    saved = {k: os.environ.get(k) for k in env}
+    os.environ.update(env)
+    try:
+        forkserver.ensure_running()
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def _apply_limits(cpu_seconds, memory_mb):
+    """Applies the policy's rlimits; raises if a requested limit can't be enforced."""
+    if not cpu_seconds and not memory_mb:
+        return
+    if resource is None:
+        raise ToolProcessError("resource limits are not supported on this platform")
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError):
+            # macOS does not enforce RLIMIT_AS; RLIMIT_DATA is the closest it has
+            resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+
+def _child_main(conn, fn, args, cpu_seconds, memory_mb):
+    try:
+        _apply_limits(cpu_seconds, memory_mb)
+    except (ValueError, OSError, ToolProcessError) as e:
+        conn.send(("error", f"tool_limits_failed: {e}"))
+        conn.close()
+        return
+    try:
+        conn.send(("ok", fn(*args)))
+    except BaseException as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+class _ToolStats:
+    __slots__ = ("calls", "running", "queued", "timeouts", "errors", "busy_seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.running = 0
+        self.queued = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+
+
+class ToolExecutor:
+    """
+    Runs registry tools under per-tool policies: a concurrency cap, a timeout that
+    keeps the {"error": "tool_timeout"} contract, and, for blocking helpers handed to
+    offload(), a thread or a resource-limited child process that is killed on timeout.
+    """
+
+    def __init__(self, registry, policies: Dict[str, ToolPolicy] = TOOL_POLICIES, max_threads: int = 16):
+        self.registry = registry
+        self.policies = policies
+        self._pool = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="aethel-tool")
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._stats: Dict[str, _ToolStats] = {}
+        self._orphaned_threads = 0
+        self._started = time.monotonic()
+        self._mp_context = _process_context()
+
+    def policy(self, tool: str) -> ToolPolicy:
+        return self.policies.get(tool, DEFAULT_POLICY)
+
+    async def run(self, tool: str, args: Dict) -> Any:
+        method = self.registry.tools.get(tool)
+        if method is None:
+            return {"error": "unknown_tool"}
+        policy = self.policy(tool)
+        sem = self._semaphores.setdefault(tool, asyncio.Semaphore(policy.max_concurrency))
+        stats = self._stats.setdefault(tool, _ToolStats())
+
+        stats.queued += 1
+        try:
+            await sem.acquire()
+        finally:
+            stats.queued -= 1
+        stats.calls += 1
+        stats.running += 1
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(method(**args), timeout=policy.timeout)
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            return {"error": "tool_timeout"}
+        except Exception as e:
+            result = {"error": str(e)}
+        finally:
+            stats.running -= 1
+            stats.busy_seconds += time.monotonic() - start
+            sem.release()
+        if isinstance(result, dict) and "error" in result:
+            stats.errors += 1
+        return result
+
+    async def offload(self, tool: str, fn: Callable, *args) -> Any:
+        """Runs a blocking helper for `tool` off the event loop, per the tool's isolation."""
+        policy = self.policy(tool)
+        if policy.isolation == "process":
+            return await self._run_in_process(policy, fn, args)
+        fut = asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        try:
+            return await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            # Threads can't be interrupted; count it until it finishes on its own
+            if not fut.done():
+                self._orphaned_threads += 1
+                fut.add_done_callback(self._thread_finished)
+            raise
+
+    def _thread_finished(self, _fut):
+        self._orphaned_threads -= 1
+
+    async def _run_in_process(self, policy: ToolPolicy, fn: Callable, args: tuple) -> Any:
+        ctx = self._mp_context
+        parent, child = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=_child_main, args=(child, fn, args, policy.cpu_seconds, policy.memory_mb), daemon=True)
+        proc.start()
+        child.close()
+
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        loop.add_reader(parent.fileno(), lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+            try:
+                status, payload = parent.recv()
+            except EOFError:
+                proc.join(1)
+                raise ToolProcessError(f"tool process killed (exit code {proc.exitcode})")
+        finally:
+            # Also runs on cancellation (timeout), which is what makes the kill real
+            loop.remove_reader(parent.fileno())
+            parent.close()
+            if proc.is_alive():
+                proc.kill()
+            proc.join(1)
+        if status == "error":
+            raise ToolProcessError(payload)
+        return payload
+
+    def stats(self) -> Dict:
+        uptime = max(time.monotonic() - self._started, 1e-9)
+        tools = {}
+        for name, s in self._stats.items():
+            cap = self.policy(name).max_concurrency
+            tools[name] = {
+                "calls": s.calls,
+                "running": s.running,
+                "queued": s.queued,
+                "timeouts": s.timeouts,
+                "errors": s.errors,
+                "max_concurrency": cap,
+                "busy_seconds": round(s.busy_seconds, 3),
+                "utilization": round(s.busy_seconds / (uptime * cap), 4),
+            }
+        return {"uptime_seconds": round(uptime, 1), "orphaned_threads": self._orphaned_threads, "tools": tools}
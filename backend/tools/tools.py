@@ -1,26 +1,189 @@
+import asyncio
+import errno
+import mmap
 import os
+import re
 import shutil
-import subprocess
 from datetime import datetime
 from typing import Dict, Any, List
 
 from core.models import PlanItem
+from tools.executor import ToolExecutor
+from tools.trigram import TrigramIndex, build_postings, grep_docs
 
 import httpx
 from bs4 import BeautifulSoup
 
+# Max bytes of file content a single tool call may return (shared across a batch)
+READ_BYTE_BUDGET = 64_000
+# Files larger than this are windowed through mmap instead of read()
+MMAP_THRESHOLD = 1_000_000
+# Cap on paths per fs_read_many / fs_write_many call
+MAX_BATCH = 32
+
+
+def _read_text(path: str, max_bytes: int) -> Dict:
+    if not os.path.isfile(path):
+        return {"error": "File not found"}
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        data = f.read(max_bytes)
+    try:
+        content = data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A budget cut can land inside a multi-byte char; anything earlier is really binary
+        if size <= max_bytes or e.start < len(data) - 3:
+            return {"error": "Binary file or encoding issue."}
+        content = data[:e.start].decode("utf-8")
+    out = {"content": content}
+    if size > max_bytes:
+        out.update({"truncated": True, "size": size})
+    return out
+
+
+def _read_window(path: str, start_line: int, end_line: int | None,
+                 offset: int | None, length: int | None, max_bytes: int) -> Dict:
+    if offset is None and end_line is not None and end_line < start_line:
+        return {"error": "invalid_range", "start_line": start_line, "end_line": end_line}
+    if not os.path.isfile(path):
+        return {"error": "File not found"}
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if size == 0:
+            return {"content": "", "size": 0}
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size > MMAP_THRESHOLD else f.read()
+        try:
+            if offset is not None:
+                start = max(0, offset)
+                stop = min(size, start + min(length or max_bytes, max_bytes))
+                out = {"offset": start, "next_offset": stop if stop < size else None}
+            else:
+                # Walk newlines to the window; mmap keeps this off the Python heap
+                start = 0
+                line = 1
+                while line < start_line:
+                    nl = buf.find(b"\n", start)
+                    if nl == -1:
+                        return {"content": "", "start_line": start_line, "size": size}
+                    start = nl + 1
+                    line += 1
+                stop = start
+                last = start_line - 1
+                limit = start + max_bytes
+                while stop < size and (end_line is None or last < end_line):
+                    nl = buf.find(b"\n", stop)
+                    nxt = size if nl == -1 else nl + 1
+                    if nxt > limit:
+                        break
+                    stop = nxt
+                    last += 1
+                out = {"start_line": start_line, "end_line": last}
+                if last < start_line and stop < size:
+                    # Single line longer than the budget: return its head
+                    stop = min(size, limit)
+                    out.update({"end_line": start_line, "truncated": True})
+                out["next_line"] = out["end_line"] + 1 if stop < size else None
+            chunk = bytes(buf[start:stop])
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+    out["content"] = chunk.decode("utf-8", errors="replace")
+    out["size"] = size
+    return out
+
+
+def _write_text(path: str, content: str) -> Dict:
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return {"status": "success"}
+
+
+def _write_many(jobs: List[tuple]) -> List[Dict]:
+    # One process for the whole batch; a failed item doesn't stop the rest
+    results = []
+    for path, content in jobs:
+        try:
+            results.append(_write_text(path, content))
+        except (OSError, ValueError) as e:
+            results.append({"error": str(e)})
+    return results
+
+
+def _make_dir(path: str) -> Dict:
+    os.makedirs(path, exist_ok=True)
+    return {"status": "created", "path": path}
+
+
+def _move_path(src: str, dst: str) -> Dict:
+    shutil.move(src, dst)
+    return {"status": "moved"}
+
+
+def _batch_result(results: List[Dict]) -> Dict:
+    out = {"results": results}
+    failed = sum(1 for r in results if "error" in r)
+    if failed:
+        # Top-level error so the kernel treats the call as failed (retry hint, plan status)
+        out.update({"error": "partial_failure", "failed": failed, "succeeded": len(results) - failed})
+    return out
+
+
+def _walk_error(top: str):
+    def onerror(err: OSError):
+        # Unreadable subfolders are skipped; a failed root or ENOMEM means the scan is bogus
+        if err.errno == errno.ENOMEM or os.path.abspath(err.filename or "") == os.path.abspath(top):
+            raise err
+    return onerror
+
+
+def _scan_folder(path: str):
+    """
+    Returns (files_seen, [{"path", "content"}]) for readable text files under path. Raises instead of returning a partial result when the scan itself fails.
+    """
+    file_count = 0
+    entries = []
+    for root, dirs, files in os.walk(path, onerror=_walk_error(path)):
+        for fname in files:
+            file_count += 1
+            fpath = os.path.join(root, fname)
+            try:
+                # Skip binary/large files
+                if os.path.getsize(fpath) > 200_000:
+                    continue
+                with open(fpath, "r", encoding="utf-8") as f:
+                    content = f.read()
+                entries.append({"path": fpath, "content": content})
+            except (OSError, UnicodeDecodeError) as e:
+                if getattr(e, "errno", None) == errno.ENOMEM:
+                    raise
+                continue
+    return file_count, entries
+
 class ToolRegistry:
     def __init__(self, kernel):
         self.kernel = kernel
         # Lightweight in-memory index store: {"path": str, "content": str}
         self._index: List[Dict[str, str]] = []
+        # Trigram postings over self._index (used by kg_grep), built in the background
+        # after each index_folder; None until the build for the current index finishes
+        self._trigrams: TrigramIndex | None = None
+        self._trigram_build: asyncio.Task | None = None
+        # Blocking work goes through the executor (thread or killable process, per tool)
+        self.executor = ToolExecutor(self)
         self.tools = {
             "ask_user": self.ask_user,
             "update_plan": self.update_plan,
             "index_folder": self.index_folder,
             "kg_search": self.kg_search,
+            "kg_grep": self.kg_grep,
             "fs_read": self.fs_read,
+            "fs_read_range": self.fs_read_range,
+            "fs_read_many": self.fs_read_many,
             "fs_write": self.fs_write,
+            "fs_write_many": self.fs_write_many,
             "fs_move": self.fs_move,
             "fs_mkdir": self.fs_mkdir,
             "mac_open_app": self.mac_open_app,
@@ -46,28 +209,44 @@ class ToolRegistry:
     async def index_folder(self, path: str) -> Dict:
         if not os.path.exists(path):
             return {"error": "Directory not found"}
-        file_count = 0
-        indexed = 0
-        self._index.clear()
-        for root, dirs, files in os.walk(path):
-            for fname in files:
-                file_count += 1
-                fpath = os.path.join(root, fname)
-                try:
-                    # Skip binary/large files
-                    if os.path.getsize(fpath) > 200_000:
-                        continue
-                    with open(fpath, "r", encoding="utf-8") as f:
-                        content = f.read()
-                    self._index.append({"path": fpath, "content": content})
-                    indexed += 1
-                except Exception:
-                    continue
+        scanned = await self._run_blocking("index_folder", _scan_folder, path)
+        if isinstance(scanned, dict):
+            return scanned
+        file_count, entries = scanned
+        if not entries:
+            # Keep the previous index; an empty scan must not wipe a good one
+            return {"error": "no_files_indexed", "files_seen": file_count,
+                    "kept_previous_index": bool(self._index)}
+        self._index = entries
+        self._start_trigram_build(entries)
+        indexed = len(entries)
         if path not in self.kernel.scratchpad.knowledge_state.indexed_directories:
             self.kernel.scratchpad.knowledge_state.indexed_directories.append(path)
         self.kernel.scratchpad.knowledge_state.last_index_time = datetime.now().isoformat()
         return {"status": "indexed", "files_seen": file_count, "files_indexed": indexed}
 
+    def _start_trigram_build(self, entries: List[Dict[str, str]]):
+        # Postings cost far more than the scan, so they are built outside index_folder's
+        # timeout and limits; kg_grep scans every file until they are ready
+        self._trigrams = None
+        if self._trigram_build and not self._trigram_build.done():
+            self._trigram_build.cancel()
+        self._trigram_build = asyncio.ensure_future(self._build_trigrams(entries))
+
+    async def _build_trigrams(self, entries: List[Dict[str, str]]):
+        timeout = self.executor.policy("kg_grep_index").timeout
+        try:
+            postings = await asyncio.wait_for(
+                self.executor.offload("kg_grep_index", build_postings, entries), timeout)
+        except asyncio.TimeoutError:
+            print("Trigram index build timed out; kg_grep will scan every file.")
+            return
+        except Exception as e:
+            print(f"Trigram index build failed ({e}); kg_grep will scan every file.")
+            return
+        if self._index is entries:
+            self._trigrams = TrigramIndex(entries, postings)
+
     async def kg_search(self, query: str) -> Dict:
         if not query:
             return {"error": "empty_query"}
@@ -89,35 +268,96 @@ class ToolRegistry:
         hits = sorted(hits, key=lambda h: h["score"], reverse=True)[:5]
         return {"results": hits}
 
+    async def kg_grep(self, pattern: str, context: int = 2, max_results: int = 50, ignore_case: bool = False) -> Dict:
+        """Regex search over indexed files; the trigram index limits which files are scanned."""
+        if not pattern:
+            return {"error": "empty_query"}
+        if not self._index:
+            return {"error": "index_empty"}
+        cand = None
+        if self._trigrams is not None:
+            try:
+                cand = self._trigrams.candidates(pattern, re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+            except re.error as e:
+                return {"error": f"invalid_regex: {e}"}
+        docs = self._index if cand is None else [self._index[i] for i in sorted(cand)]
+        if not docs:
+            return {"results": [], "files_scanned": 0, "files_indexed": len(self._index), "truncated": False}
+        # A model-written regex can backtrack catastrophically and re holds the GIL while
+        # matching, so only the candidates are matched, in a process the timeout can kill
+        out = await self._run_blocking("kg_grep", grep_docs, docs, pattern,
+                                       max(0, int(context)), max(1, int(max_results)), bool(ignore_case))
+        if "error" not in out:
+            out["files_indexed"] = len(self._index)
+            if self._trigrams is None:
+                building = self._trigram_build is not None and not self._trigram_build.done()
+                out["trigram_index"] = "building" if building else "unavailable"
+        return out
+
+    async def _run_blocking(self, tool: str, fn, *args):
+        try:
+            return await self.executor.offload(tool, fn, *args)
+        except Exception as e:
+            return {"error": str(e)}
+
     async def fs_read(self, path: str) -> Dict:
         if not os.path.exists(path): return {"error": "File not found"}
-        try:
-            with open(path, "r", encoding='utf-8') as f: return {"content": f.read()}
-        except UnicodeDecodeError:
-            return {"error": "Binary file or encoding issue."}
+        return await self._run_blocking("fs_read", _read_text, path, READ_BYTE_BUDGET)
+
+    async def fs_read_range(self, path: str, start_line: int = 1, end_line: int | None = None,
+                            offset: int | None = None, length: int | None = None) -> Dict:
+        """Line window (start_line..end_line, 1-based) or byte range (offset/length), capped at the read budget."""
+        return await self._run_blocking("fs_read_range", _read_window, path, max(1, int(start_line)),
+                                        None if end_line is None else int(end_line),
+                                        None if offset is None else int(offset),
+                                        None if length is None else int(length),
+                                        READ_BYTE_BUDGET)
+
+    async def fs_read_many(self, paths: list) -> Dict:
+        if not isinstance(paths, list) or not paths:
+            return {"error": "invalid_paths"}
+        if len(paths) > MAX_BATCH:
+            return {"error": "batch_too_large", "max_batch": MAX_BATCH, "received": len(paths)}
+        paths = [str(p) for p in paths]
+        # Split the call budget evenly so one large file can't starve the rest
+        per_file = max(1024, READ_BYTE_BUDGET // len(paths))
+        results = await asyncio.gather(*(self._run_blocking("fs_read_many", _read_text, p, per_file) for p in paths))
+        return _batch_result([{"path": p, **r} for p, r in zip(paths, results)])
 
     async def fs_write(self, path: str, content: str) -> Dict:
-        # Ensure parent directory exists
-        parent = os.path.dirname(path)
-        if parent:
-            os.makedirs(parent, exist_ok=True)
-        with open(path, "w", encoding='utf-8') as f: f.write(content)
-        return {"status": "success"}
+        return await self._run_blocking("fs_write", _write_text, path, content)
+
+    async def fs_write_many(self, files: list) -> Dict:
+        if not isinstance(files, list) or not files:
+            return {"error": "invalid_files"}
+        if len(files) > MAX_BATCH:
+            # Reject outright rather than write a prefix the model would take as the whole batch
+            return {"error": "batch_too_large", "max_batch": MAX_BATCH, "received": len(files)}
+        jobs = []
+        for item in files:
+            if not isinstance(item, dict) or not item.get("path"):
+                return {"error": "invalid_files"}
+            jobs.append((str(item["path"]), str(item.get("content", ""))))
+        results = await self._run_blocking("fs_write_many", _write_many, jobs)
+        if isinstance(results, dict):
+            return results
+        return _batch_result([{"path": p, **r} for (p, _), r in zip(jobs, results)])
 
     async def fs_mkdir(self, path: str) -> Dict:
-        try:
-            os.makedirs(path, exist_ok=True)
-            return {"status": "created", "path": path}
-        except Exception as e:
-            return {"error": str(e)}
+        return await self._run_blocking("fs_mkdir", _make_dir, path)
 
     async def fs_move(self, src: str, dst: str) -> Dict:
         if not os.path.exists(src): return {"error": "Source not found"}
-        shutil.move(src, dst)
-        return {"status": "moved"}
+        return await self._run_blocking("fs_move", _move_path, src, dst)
 
     async def mac_open_app(self, app_name: str) -> Dict:
-        subprocess.run(["open", "-a", app_name])
+        # Async subprocess so a timeout actually kills `open` instead of blocking the loop
+        proc = await asyncio.create_subprocess_exec("open", "-a", app_name)
+        try:
+            await proc.wait()
+        except asyncio.CancelledError:
+            proc.kill()
+            raise
         return {"status": "opened"}
 
     # --- NEW INTERNET TOOL ---
@@ -154,8 +394,12 @@ class ToolRegistry:
             ("update_plan", '{"plan": ["item1", "item2"]}'),
             ("index_folder", '{"path": "string"}'),
             ("kg_search", '{"query": "string"}'),
+            ("kg_grep", '{"pattern": "regex", "context": 2}'),
             ("fs_read", '{"path": "string"}'),
+            ("fs_read_range", '{"path": "string", "start_line": 1, "end_line": 200}'),
+            ("fs_read_many", '{"paths": ["a.txt", "b.txt"]}'),
             ("fs_write", '{"path": "string", "content": "string"}'),
+            ("fs_write_many", '{"files": [{"path": "string", "content": "string"}]}'),
             ("fs_mkdir", '{"path": "string"}'),
             ("fs_move", '{"src": "string", "dst": "string"}'),
             ("mac_open_app", '{"app_name": "string"}'),
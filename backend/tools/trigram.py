@@ -0,0 +1,190 @@
+import re
+import string
+from array import array
+from typing import Dict, Iterable, List, Optional, Set
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+_REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT}
+if hasattr(sre_parse, "POSSESSIVE_REPEAT"):
+    _REPEATS.add(sre_parse.POSSESSIVE_REPEAT)
+
+
+def _re_ascii_folds() -> Dict[int, str]:
+    """Non-ASCII chars that re's IGNORECASE treats as equal to an ASCII letter (e.g. İ -> i)."""
+    chars = "".join(chr(c) for c in range(0x80, 0x10000) if not 0xD800 <= c < 0xE000)
+    folds = {}
+    for ch in set(re.findall(r"[a-z]", chars, re.IGNORECASE)):
+        folds[ord(ch)] = next(a for a in string.ascii_lowercase if re.fullmatch(a, ch, re.IGNORECASE))
+    return folds
+
+
+_ASCII_FOLDS = _re_ascii_folds()
+
+
+def _fold(text: str) -> bytes:
+    """
+    Index form of text, applied char by char to docs and query literals alike:
+    ASCII is lowercased and the chars re folds onto ASCII letters are mapped to them.
+    Other chars keep their case, so they are only usable for case-sensitive queries.
+    """
+    if not text.isascii():
+        text = text.translate(_ASCII_FOLDS)
+    return text.encode("utf-8").lower()
+
+
+def _trigram_ids(data: bytes) -> Iterable[int]:
+    """
+    Every 3-byte window of data as a 24-bit int. The windows are laid out as zero-padded
+    4-byte words so the conversion and the dedupe stay in C, with no per-position objects.
+    """
+    m = len(data) - 2
+    if m <= 0:
+        return ()
+    words = bytearray(4 * m)
+    for k in range(3):
+        words[k::4] = data[k:k + m]
+    return memoryview(words).cast("I")
+
+
+def build_postings(docs: List[Dict[str, str]]) -> Dict[int, array]:
+    """
+    Maps every trigram id (over the folded UTF-8 text) to the ascending ids
+    (list positions) of the docs containing it.
+    """
+    postings: Dict[int, array] = {}
+    get = postings.get
+    for doc_id, doc in enumerate(docs):
+        for tri in set(_trigram_ids(_fold(doc["content"]))):
+            bucket = get(tri)
+            if bucket is None:
+                postings[tri] = array("I", (doc_id,))
+            else:
+                bucket.append(doc_id)
+    return postings
+
+
+def _query_plan(parsed, ignore_case: bool):
+    """
+    Reduces a parsed regex to the literals any match must contain:
+    ("and", [...]), ("or", [...]) or ("lit", str). Anything not provably required
+    (classes, optional repeats, anchors) just ends the current literal run, and so
+    does a non-ASCII char under IGNORECASE (the index doesn't case-fold those).
+    """
+    parts = []
+    run: List[str] = []
+
+    def flush():
+        if run:
+            parts.append(("lit", "".join(run)))
+            run.clear()
+
+    for op, av in parsed:
+        if op is sre_parse.LITERAL and (av < 0x80 or not ignore_case):
+            run.append(chr(av))
+        elif op is sre_parse.SUBPATTERN:
+            _group, add_flags, del_flags, sub = av
+            flush()
+            sub_ic = bool(add_flags & re.IGNORECASE) or (ignore_case and not del_flags & re.IGNORECASE)
+            parts.append(_query_plan(sub, sub_ic))
+        elif op is sre_parse.BRANCH:
+            flush()
+            parts.append(("or", [_query_plan(branch, ignore_case) for branch in av[1]]))
+        elif op in _REPEATS:
+            lo, _hi, sub = av
+            flush()
+            if lo >= 1:
+                parts.append(_query_plan(sub, ignore_case))
+        else:
+            flush()
+    flush()
+    return ("and", parts)
+
+
+class TrigramIndex:
+    """Trigram postings over the folder index; narrows regex search to candidate files."""
+
+    def __init__(self, docs: List[Dict[str, str]], postings: Dict[int, array]):
+        self.docs = docs
+        self.postings = postings
+
+    def _candidates(self, node) -> Optional[Set[int]]:
+        # None means "no constraint": every doc is a candidate
+        kind, value = node
+        if kind == "lit":
+            tris = set(_trigram_ids(_fold(value)))
+            if not tris:
+                return None
+            lists = sorted((self.postings.get(t, ()) for t in tris), key=len)
+            result = set(lists[0])
+            for other in lists[1:]:
+                if not result:
+                    break
+                result.intersection_update(other)
+            return result
+        if kind == "and":
+            result = None
+            for child in value:
+                sub = self._candidates(child)
+                if sub is None:
+                    continue
+                result = sub if result is None else result & sub
+            return result
+        # "or": any unconstrained branch makes the whole alternation unconstrained
+        result: Set[int] = set()
+        for child in value:
+            sub = self._candidates(child)
+            if sub is None:
+                return None
+            result |= sub
+        return result
+
+    def candidates(self, pattern: str, flags: int = 0) -> Optional[Set[int]]:
+        parsed = sre_parse.parse(pattern, flags)
+        return self._candidates(_query_plan(parsed, bool(parsed.state.flags & re.IGNORECASE)))
+
+
+def _grep_flags(ignore_case: bool) -> int:
+    return re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+
+
+def grep_docs(docs: List[Dict[str, str]], pattern: str, context: int = 2,
+              max_results: int = 50, ignore_case: bool = False) -> Dict:
+    """Runs the regex over the given (candidate) docs and returns file/line hits with context."""
+    try:
+        regex = re.compile(pattern, _grep_flags(ignore_case))
+    except re.error as e:
+        return {"error": f"invalid_regex: {e}"}
+
+    results = []
+    truncated = False
+    for doc in docs:
+        content = doc["content"]
+        lines = None
+        pos = 0
+        line_no = 0
+        last_line = -1
+        for m in regex.finditer(content):
+            if lines is None:
+                lines = content.split("\n")
+            line_no += content.count("\n", pos, m.start())
+            pos = m.start()
+            if line_no == last_line:
+                continue  # one hit per line
+            last_line = line_no
+            if len(results) >= max_results:
+                truncated = True
+                break
+            lo = max(0, line_no - context)
+            results.append({
+                "path": doc["path"],
+                "line": line_no + 1,
+                "match": m.group(0)[:200],
+                "context": lines[lo:line_no + context + 1],
+            })
+        if truncated:
+            break
+    return {"results": results, "files_scanned": len(docs), "truncated": truncated}
@@ -0,0 +1,33 @@
+"""
+Preloaded once by the tool fork server (see tools.executor._process_context); every
+tool process is forked from it with this module already in place.
+
+Tool processes never run the server's main module: multiprocessing would otherwise
+re-import it (FastAPI, uvicorn, speech_recognition, ...) in each child before the
+policy's limits apply. A placeholder __main__ carrying the server's main path/name
+makes multiprocessing treat it as already loaded. So blocking helpers handed to
+offload() must live in importable modules, never in __main__.
+"""
+import json
+import os
+import sys
+import types
+from importlib.machinery import ModuleSpec
+
+MAIN_ENV = "AETHEL_TOOL_MAIN"
+
+
+def _install_placeholder_main(data: dict):
+    main = types.ModuleType("__mp_main__")
+    if "init_main_from_name" in data:
+        main.__spec__ = ModuleSpec(data["init_main_from_name"], None)
+    if "init_main_from_path" in data:
+        main.__file__ = data["init_main_from_path"]
+    sys.modules["__main__"] = sys.modules["__mp_main__"] = main
+
+
+if os.environ.get(MAIN_ENV):
+    _install_placeholder_main(json.loads(os.environ[MAIN_ENV]))
+
+# The tool helpers, so no call pays for importing them either
+import tools.tools  # noqa: E402,F401